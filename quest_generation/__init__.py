@@ -2,3 +2,7 @@ from .document_utils import *
 from .env_utils import *
 from .vectorstore_utils import *
 from .ai_agent import *
+from .question_bank import *
+from .question_store import *
+from .question_validation import *
+from .prompts import *
@@ -1,19 +1,25 @@
-from typing import Annotated, Sequence, TypedDict, Literal, List
+from typing import Annotated, Sequence, TypedDict, Literal, List, Dict, Optional
 from langchain_core.messages import BaseMessage
 from langchain_core.messages import BaseMessage, HumanMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import BaseTool
 from langchain_openai import ChatOpenAI
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 
 from langgraph.prebuilt import tools_condition, ToolNode
 from langgraph.graph import END, StateGraph, START
 from langgraph.graph.message import add_messages
 
 from .document_utils import load_documents, split_text
+from .prompts import invoke_prompt, invoke_structured_prompt, prompt_cache_stats
+from .question_validation import (
+    REQUIRED_FIELDS,
+    validate_question,
+    validation_stats,
+)
 from .vectorstore_utils import (
+    MetadataIndex,
     create_vectorstore_retriever,
     create_retriever_tool,
     create_vectorstore,
@@ -28,13 +34,22 @@ class ToolConfig:
     """Class to manage and initialize tools for the workflow."""
 
     def __init__(
-        self, document_path: str = "", chunk_size: int = 1000, chunk_overlap: int = 200
+        self,
+        document_path: str = "",
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        metadata_filter: Optional[Dict[str, List]] = None,
+        metadata_index_path: str = "metadata_index.json",
     ):
         """Initialize tools with configurable parameters."""
         self.document_path = document_path
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.metadata_index_path = metadata_index_path
+        self.metadata_filter = None
         self.tools: List[BaseTool] = self._initialize_tools()
+        if metadata_filter:
+            self.set_metadata_filter(metadata_filter)
 
     def _initialize_tools(self) -> List[BaseTool]:
         """Private method to initialize the retriever tool."""
@@ -46,16 +61,66 @@ class ToolConfig:
             docs_list, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
         )
         # Create vectorstore with Pinecone
-        vectorstore = create_vectorstore(docs_split, index_name="medical-documents")
-        # Create retriever and tool
-        retriever = create_vectorstore_retriever(vectorstore)
+        self.vectorstore = create_vectorstore(
+            docs_split,
+            index_name="medical-documents",
+            metadata_index_path=self.metadata_index_path,
+        )
+        # Scopes come from the chunks saved when the vector store was populated,
+        # not from the local documents, which may not be the ones it holds
+        self.metadata_index = MetadataIndex.load(self.metadata_index_path)
+        return self._create_retriever_tools()
+
+    def _create_retriever_tools(self) -> List[BaseTool]:
+        """Private method to create the retriever tool for the current filter."""
+        retriever = create_vectorstore_retriever(
+            self.vectorstore, metadata_filter=self.metadata_filter
+        )
         retriever_prompt = "retrieve_medical_references. Search and return information necessary to make evidence-based questions. Always use this tool before generating questions."
 
+        # Keep the retrieved Documents as the message artifact to trace source chunks
         retriever_tool = create_retriever_tool(
-            retriever, description=retriever_prompt, name="retriever_tool"
+            retriever,
+            description=retriever_prompt,
+            name="retriever_tool",
+            response_format="content_and_artifact",
         )
         return [retriever_tool]
 
+    def set_metadata_filter(self, metadata_filter: Optional[Dict[str, List]]):
+        """
+        Restrict retrieval to chunks whose metadata match the filter.
+
+        A filter that matches no chunk would make every retrieval come back
+        empty and loop between `rewrite` and `agent`, so filters are checked
+        against the metadata index of the vector store and rejected when they
+        cannot be.
+
+        Args:
+            metadata_filter (dict): Metadata key (e.g. "source", "specialty")
+                mapped to the allowed values, or None to search the whole corpus.
+
+        Raises:
+            ValueError: If there is no metadata index to check the filter
+                against, a key is not indexed, or no stored chunk matches.
+        """
+        metadata_filter = {k: v for k, v in (metadata_filter or {}).items() if v}
+        if metadata_filter:
+            if not self.metadata_index.size:
+                raise ValueError(
+                    "Retrieval can only be scoped when the metadata index "
+                    f"'{self.metadata_index_path}' of the vector store exists."
+                )
+            unknown = sorted(set(metadata_filter) - set(self.metadata_index.keys))
+            if unknown:
+                raise ValueError(f"Metadata keys {unknown} are not indexed.")
+            if not self.metadata_index.candidates(metadata_filter):
+                raise ValueError(
+                    f"No stored chunk matches the filter {metadata_filter}."
+                )
+        self.metadata_filter = metadata_filter or None
+        self.tools = self._create_retriever_tools()
+
     def get_tools(self) -> List[BaseTool]:
         """Public method to access initialized tools."""
         return self.tools
@@ -69,6 +134,12 @@ class AgentState(TypedDict):
     tools: List[BaseTool]
 
 
+class grade(BaseModel):
+    """Binary score for relevance check."""
+
+    binary_score: str = Field(description="Relevance score 'yes' or 'no'")
+
+
 def grade_documents(state) -> Literal["generate", "rewrite"]:
     """
     Determines whether the retrieved documents are relevant to the question.
@@ -82,37 +153,20 @@ def grade_documents(state) -> Literal["generate", "rewrite"]:
 
     print("---CHECK RELEVANCE---")
 
-    # Data model
-    class grade(BaseModel):
-        """Binary score for relevance check."""
-
-        binary_score: str = Field(description="Relevance score 'yes' or 'no'")
-
     # LLM
-    model = ChatOpenAI(temperature=0, model="gpt-4o-mini", streaming=True)
-
-    # LLM with tool and validation
-    llm_with_tool = model.with_structured_output(grade)
-
-    # Prompt
-    prompt = PromptTemplate(
-        template="""
-        You are a grader assessing the relevance of a retrieved document to a user request in a medical context. Here is the retrieved document: {context} Here is the user request: {question} If the document contains keywords or semantic meaning related to the medical topic of the user question, grade it as relevant. Provide a binary score 'yes' or 'no'.""",
-        input_variables=["context", "question"],
+    model = ChatOpenAI(
+        temperature=0, model="gpt-4o-mini", streaming=True, stream_usage=True
     )
 
-    # Chain
-    chain = prompt | llm_with_tool
-
     messages = state["messages"]
     last_message = messages[-1]
 
     question = messages[0].content
     docs = last_message.content
 
-    clinical_scenario = state["clinical_scenario"]
-
-    scored_result = chain.invoke({"question": question, "context": docs})
+    scored_result = invoke_structured_prompt(
+        "grade_documents", model, grade, question=question, context=docs
+    )
 
     score = scored_result.binary_score
 
@@ -140,9 +194,12 @@ def agent(state):
     print("---CALL AGENT---")
     tools = state["tools"]
     messages = state["messages"]
-    model = ChatOpenAI(temperature=0, streaming=True, model="gpt-4o-mini")
+    model = ChatOpenAI(
+        temperature=0, streaming=True, model="gpt-4o-mini", stream_usage=True
+    )
     model = model.bind_tools(tools)
     response = model.invoke(messages)
+    prompt_cache_stats.record("agent", response)
     # We return a list, because this will get added to the existing list
     return {"messages": [response]}
 
@@ -161,15 +218,10 @@ def create_clinical_scenario(state):
     messages = state["messages"]
     question = messages[0].content
 
-    msg = [
-        HumanMessage(
-            content=f""" \n
-            Based on the following user question, generate a detailed clinical case scenario in Portuguese that sets up a situation where a medical student would need to apply specific medical knowledge to make a diagnosis, choose a treatment, or understand a medical concept. The scenario should include a patient’s history, symptoms, diagnostic tests, and relevant medical context to create a realistic and educational case. Ensure that the scenario naturally leads to a question or decision point that can be used to assess the student's understanding. Here is the user question: {question}""",
-        )
-    ]
-
-    model = ChatOpenAI(temperature=0, model="gpt-4o-mini", streaming=True)
-    response = model.invoke(msg)
+    model = ChatOpenAI(
+        temperature=0, model="gpt-4o-mini", streaming=True, stream_usage=True
+    )
+    response = invoke_prompt("create_clinical_scenario", model, question=question)
     return {"clinical_scenario": response.content}
 
 
@@ -189,19 +241,43 @@ def rewrite(state):
     question = messages[0].content
     clinical_scenario = state["clinical_scenario"]
 
-    msg = [
-        HumanMessage(
-            content=f""" \n 
-    Given the original user question and the generated clinical scenario, reformulate the question in Portuguese to better target the retrieval of medical documents that provide information relevant to the medical decision or concept highlighted in the clinical scenario. The improved question should combine key elements from both the original question and the clinical scenario to ensure the retrieved documents are highly relevant. Original question: {question} Clinical scenario: {clinical_scenario}""",
-        )
-    ]
-
     # Grader
-    model = ChatOpenAI(temperature=0, model="gpt-4o-mini", streaming=True)
-    response = model.invoke(msg)
+    model = ChatOpenAI(
+        temperature=0, model="gpt-4o-mini", streaming=True, stream_usage=True
+    )
+    response = invoke_prompt(
+        "rewrite", model, question=question, clinical_scenario=clinical_scenario
+    )
     return {"messages": [response]}
 
 
+class generate_question(BaseModel):
+    """Structured Output for question generation"""
+
+    enunciate: str = Field(
+        description="Enunciate of the question to be generated. \n"
+        "The enunciate must be a question that assesses the student's understanding of the content\n"
+        "asket by the user request. NAO DIGA 'BASEADO NO DOCUMENTO FORNECIDO' APENAS ESCREVA O ENUNCIADO. Just ask the question.\n"
+    )
+    alternatives: list[str] = Field(
+        description="A list of 5 items, each containing one alternative of the generated question.\n"
+        "Only one alternative can be right"
+    )
+    alt_explanations: list[str] = Field(
+        description="A list of 5 items containing the explanation for each one of the alternatives\n"
+        "The explanations indices must match the corresponding alternatives indices"
+    )
+    question_explanation: str = Field(
+        description="An overall explanation of the content of the question that was generated\n"
+        "so the student that answered the question may deepen its understanding and \n"
+        "revisit the content asked"
+    )
+    learning_objective: str = Field(
+        description="A short expression or phrase that briefly summarizes the content asked by the \n"
+        "generated question"
+    )
+
+
 def generate(state):
     """
     Generate answer
@@ -217,75 +293,28 @@ def generate(state):
     question = messages[0].content
     last_message = messages[-1]
 
-    class generate_question(BaseModel):
-        """Structured Output for question generation"""
-
-        enunciate: str = Field(
-            description="Enunciate of the question to be generated. \n"
-            "The enunciate must be a question that assesses the student's understanding of the content\n"
-            "asket by the user request. NAO DIGA 'BASEADO NO DOCUMENTO FORNECIDO' APENAS ESCREVA O ENUNCIADO. Just ask the question.\n"
-        )
-        alternatives: list[str] = Field(
-            description="A list of 5 items, each containing one alternative of the generated question.\n"
-            "Only one alternative can be right"
-        )
-        alt_explanations: list[str] = Field(
-            description="A list of 5 items containing the explanation for each one of the alternatives\n"
-            "The explanations indices must match the corresponding alternatives indices"
-        )
-        question_explanation: str = Field(
-            description="An overall explanation of the content of the question that was generated\n"
-            "so the student that answered the question may deepen its understanding and \n"
-            "revisit the content asked"
-        )
-        learning_objective: str = Field(
-            description="A short expression or phrase that briefly summarizes the content asked by the \n"
-            "generated question"
-        )
-
     docs = last_message.content
+    source_chunk_ids = [
+        doc.metadata.get("chunk_id") or doc.id
+        for doc in getattr(last_message, "artifact", None) or []
+        if doc.metadata.get("chunk_id") or doc.id
+    ]
 
     clinical_scenario = state["clinical_scenario"]
 
-    # Prompt
-    prompt = PromptTemplate(
-        template="""
-Você é um professor criando uma questão de múltipla escolha para uma avaliação de conhecimento médico. Você receberá um cenário clínico, uma solicitação do usuário e um documento recuperado com informações médicas relevantes.
-
-Sua tarefa é formular uma questão em português que avalie o entendimento do aluno sobre os conceitos médicos necessários para abordar a situação descrita no cenário clínico, com base nas informações do documento recuperado.
-
-Aqui está o cenário clínico: {clinical_scenario}
-Aqui está a solicitação do usuário: {question}
-Aqui está o documento recuperado: {context}
-
-Instruções:
-1. Escreva a questão em português. 
-2. O enunciado da questão deve incluir explicitamente uma quantidade considerável de detalhes relevantes do cenário clínico, como idade do paciente, sintomas, histórico médico ou resultados de exames, para fornecer contexto suficiente para que o aluno responda sem precisar consultar o cenário separadamente.
-3. Certifique-se de que a questão esteja diretamente relacionada ao conteúdo médico necessário para entender ou resolver o cenário clínico, conforme informado pela solicitação do usuário e pelo documento.
-4. Forneça cinco alternativas (A a E), com apenas uma resposta correta.
-5. Para cada alternativa, forneça explicação em português, justificando por que ela está correta ou incorreta. A explicação deve conter os conceitos médicos envolvidos na alternativa e o motivo aprofundado da justificação. Se ela for correta deve conter início: (CORRETA), caso seja incorreta deve conter início (INCORRETA)
-6. Forneça uma explicação geral da questão em português, detalhando os conceitos médicos envolvidos.
-7. Indique o objetivo de aprendizagem em português, resumindo o principal conhecimento médico que a questão está testando.
-
-Garanta que a questão seja clara, concisa e eficaz para testar o entendimento do aluno sobre os conceitos médicos relevantes.
-""",
-        input_variables=["context", "question", "clinical_scenario"],
-    )
-
     # LLM
-    llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0, streaming=True)
-    llm_with_tool = llm.with_structured_output(generate_question)
-
-    # Post-processing
-    def format_docs(docs):
-        return "\n\n".join(doc.page_content for doc in docs)
-
-    # Chain
-    rag_chain = prompt | llm_with_tool
+    llm = ChatOpenAI(
+        model_name="gpt-4o-mini", temperature=0, streaming=True, stream_usage=True
+    )
 
     # Run
-    response = rag_chain.invoke(
-        {"context": docs, "question": question, "clinical_scenario": clinical_scenario}
+    response = invoke_structured_prompt(
+        "generate",
+        llm,
+        generate_question,
+        context=docs,
+        question=question,
+        clinical_scenario=clinical_scenario,
     )
     response = response.dict()
     response_message = {
@@ -297,6 +326,7 @@ Garanta que a questão seja clara, concisa e eficaz para testar o entendimento d
                 "alt_explanations": response["alt_explanations"],
                 "question_explanation": response["question_explanation"],
                 "learning_objective": response["learning_objective"],
+                "source_chunk_ids": source_chunk_ids,
             },
             ensure_ascii=False,
         ),
@@ -304,6 +334,120 @@ Garanta que a questão seja clara, concisa e eficaz para testar o entendimento d
     return {"messages": [response_message]}
 
 
+MAX_REPAIR_CALLS = 2
+
+
+def repair_question(payload, errors, question, context, clinical_scenario):
+    """
+    Ask the model to rewrite only the broken fields of a generated question.
+
+    Args:
+        payload (dict): The generated question in the `generate` output format.
+        errors (dict): Broken field mapped to what is wrong with it.
+        question (str): The user request.
+        context (str): The retrieved document the question was generated from.
+        clinical_scenario (str): The clinical scenario of the question.
+
+    Returns:
+        dict: The repaired fields, in the `generate` output format.
+    """
+    broken = set(errors)
+    # Rewriting the alternatives invalidates their explanations
+    if "alternatives" in broken:
+        broken.add("alt_explanations")
+    # The JSON output calls "question" what the structured output calls "enunciate"
+    to_model = {"question": "enunciate"}
+    to_output = {v: k for k, v in to_model.items()}
+    model_fields = {
+        to_model.get(field, field): (
+            generate_question.model_fields[to_model.get(field, field)].annotation,
+            generate_question.model_fields[to_model.get(field, field)],
+        )
+        # A fixed field order keeps the repair schema, part of the cached
+        # prompt prefix, identical across processes
+        for field in REQUIRED_FIELDS
+        if field in broken
+    }
+    repair_model = create_model(
+        "repair_question",
+        __doc__="Structured Output with the repaired fields of the question",
+        **model_fields,
+    )
+
+    problems = "\n".join(f"- {field}: {problem}" for field, problem in errors.items())
+    model = ChatOpenAI(
+        temperature=0, model="gpt-4o-mini", streaming=True, stream_usage=True
+    )
+    response = invoke_structured_prompt(
+        "repair_question",
+        model,
+        repair_model,
+        context=context,
+        clinical_scenario=clinical_scenario,
+        question=question,
+        problems=problems,
+        payload=json.dumps(payload, ensure_ascii=False),
+    )
+    return {to_output.get(k, k): v for k, v in response.model_dump().items()}
+
+
+def validate(state):
+    """
+    Check the generated question locally and repair only its broken fields.
+
+    Args:
+        state (messages): The current state
+
+    Returns:
+        dict: The updated state with the generated question replaced by the
+            repaired one, if a repair was needed
+    """
+    print("---VALIDATE---")
+    messages = state["messages"]
+    last_message = messages[-1]
+    payload = json.loads(last_message.content)
+
+    errors = validate_question(payload)
+    if not errors:
+        validation_stats.record("passed")
+        print("---DECISION: QUESTION VALID---")
+        print(f"---VALIDATION STATS: {validation_stats.report()}---")
+        return {"messages": []}
+
+    question = messages[0].content
+    docs = messages[-2].content
+    clinical_scenario = state["clinical_scenario"]
+
+    repair_calls = 0
+    while errors and repair_calls < MAX_REPAIR_CALLS:
+        print(f"---REPAIR: {', '.join(errors)}---")
+        repair_calls += 1
+        try:
+            payload.update(
+                repair_question(payload, errors, question, docs, clinical_scenario)
+            )
+        except Exception as e:
+            print(f"---REPAIR FAILED: {e}---")
+        errors = validate_question(payload)
+
+    if errors:
+        validation_stats.record("failed", repair_calls)
+        print("---DECISION: QUESTION INVALID---")
+        payload["validation_errors"] = errors
+    else:
+        validation_stats.record("repaired", repair_calls)
+        print("---DECISION: QUESTION REPAIRED---")
+    print(f"---VALIDATION STATS: {validation_stats.report()}---")
+
+    # Reusing the message id replaces the generated question instead of appending
+    response_message = {
+        "role": "assistant",
+        "content": json.dumps(payload, ensure_ascii=False),
+        "id": last_message.id,
+    }
+    return {"messages": [response_message]}
+
+
 def create_graph(tool_config: ToolConfig):
     """
     Create a state graph for the agent.
@@ -328,6 +472,7 @@ def create_graph(tool_config: ToolConfig):
     workflow.add_node(
         "generate", generate
     )  # Generating a response after we know the documents are relevant
+    workflow.add_node("validate", validate)  # Checking and repairing the output
     # Call agent node to decide to retrieve or not
     workflow.add_edge(START, "create_clinical_scenario")
     workflow.add_edge("create_clinical_scenario", "agent")
@@ -341,7 +486,8 @@ def create_graph(tool_config: ToolConfig):
         # Assess agent decision
         grade_documents,
     )
-    workflow.add_edge("generate", END)
+    workflow.add_edge("generate", "validate")
+    workflow.add_edge("validate", END)
     workflow.add_edge("rewrite", "agent")
 
     # Compile
@@ -1,10 +1,21 @@
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
+import os
+
+from .vectorstore_utils import MetadataIndex
 
 
 def load_documents(paths):
-    """Load documents from specified paths and split them into chunks."""
+    """
+    Load documents from specified paths and split them into chunks.
+
+    Guidelines are expected under a folder named after their specialty, e.g.
+    `docs/cardiologia/hipertensao.pdf`. Each page gets the file name as
+    `source` and the folder name as `specialty`, so retrieval scopes do not
+    depend on where the files live on the machine that ingested them. The full
+    path stays in PyMuPDF's `file_path`.
+    """
     # Load environment variables
     # Specify the paths to the PDF files
     if paths:
@@ -12,6 +23,11 @@ def load_documents(paths):
 
         docs = [PyMuPDFLoader(path).load() for path in paths]
         docs_list = [item for sublist in docs for item in sublist]
+        for path, sublist in zip(paths, docs):
+            specialty = os.path.basename(os.path.dirname(os.path.abspath(path)))
+            for doc in sublist:
+                doc.metadata["source"] = os.path.basename(path)
+                doc.metadata["specialty"] = specialty
         print("Documents loaded successfully!")
         return docs_list
     else:
@@ -33,13 +49,16 @@ def split_text(docs_list, chunk_size=1000, chunk_overlap=200):
         return None
 
 
-def add_new_document(docs_split, vectorstore):
+def add_new_document(
+    docs_split, vectorstore, metadata_index_path="metadata_index.json"
+):
     """
     Add document chunks to the Pinecone vector store, preserving PyMuPDFLoader metadata.
 
     Args:
         docs_split (list): List of document chunks from split_text (Document objects).
         vectorstore (PineconeVectorStore): The Pinecone vector store instance.
+        metadata_index_path (str): MetadataIndex file extended with the added chunks.
     """
     # Prepare documents with existing metadata
     documents_to_add = []
@@ -60,6 +79,10 @@ def add_new_document(docs_split, vectorstore):
 
     # Add all documents to Pinecone in one batch
     vectorstore.add_documents(documents_to_add)
+    if metadata_index_path:
+        metadata_index = MetadataIndex.load(metadata_index_path)
+        metadata_index.add(documents_to_add)
+        metadata_index.save(metadata_index_path)
     print(
         f"Added {len(documents_to_add)} chunks to Pinecone vector store with PyMuPDFLoader metadata."
     )
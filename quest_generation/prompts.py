@@ -0,0 +1,186 @@
+from typing import Dict
+
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+import threading
+
+
+class CachedPrompt:
+    """
+    A prompt split into a static prefix and a variable suffix.
+
+    The prefix holds every instruction and is sent first, unchanged between
+    calls, so the provider can reuse its cached prefix. Only the suffix is
+    filled in with the request's variables.
+    """
+
+    def __init__(self, name: str, prefix: str, suffix: str):
+        self.name = name
+        self.prefix = prefix
+        self.suffix = suffix
+        # The prefix is a literal message, so braces in it are never templated
+        self.template = ChatPromptTemplate.from_messages(
+            [SystemMessage(content=prefix), ("human", suffix)]
+        )
+
+    def format_messages(self, **variables):
+        """Return the prompt messages for the given variables."""
+        return self.template.format_messages(**variables)
+
+
+class PromptCacheStats:
+    """Thread-safe counters of input and cached tokens per prompt."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls: Dict[str, int] = {}
+            self.input_tokens: Dict[str, int] = {}
+            self.cached_tokens: Dict[str, int] = {}
+
+    def record(self, name: str, message):
+        """
+        Record the token usage reported with a model response.
+
+        Args:
+            name (str): The prompt that produced the response.
+            message (AIMessage): The raw model response.
+        """
+        usage = getattr(message, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.input_tokens[name] = self.input_tokens.get(name, 0) + input_tokens
+            self.cached_tokens[name] = self.cached_tokens.get(name, 0) + cached_tokens
+        print(
+            f"---PROMPT CACHE: {name} {cached_tokens}/{input_tokens} "
+            "input tokens cached---"
+        )
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Return, per prompt, the calls, token counts and cache-hit rate."""
+        with self._lock:
+            return {
+                name: {
+                    "calls": self.calls[name],
+                    "input_tokens": self.input_tokens[name],
+                    "cached_tokens": self.cached_tokens[name],
+                    "cache_hit_rate": (
+                        self.cached_tokens[name] / self.input_tokens[name]
+                        if self.input_tokens[name]
+                        else 0.0
+                    ),
+                }
+                for name in self.calls
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+PROMPTS = {
+    prompt.name: prompt
+    for prompt in [
+        CachedPrompt(
+            "grade_documents",
+            prefix="You are a grader assessing the relevance of a retrieved document to a user request in a medical context. If the document contains keywords or semantic meaning related to the medical topic of the user question, grade it as relevant. Provide a binary score 'yes' or 'no'.",
+            suffix="Here is the retrieved document: {context}\n"
+            "Here is the user request: {question}",
+        ),
+        CachedPrompt(
+            "create_clinical_scenario",
+            prefix="Based on the following user question, generate a detailed clinical case scenario in Portuguese that sets up a situation where a medical student would need to apply specific medical knowledge to make a diagnosis, choose a treatment, or understand a medical concept. The scenario should include a patient’s history, symptoms, diagnostic tests, and relevant medical context to create a realistic and educational case. Ensure that the scenario naturally leads to a question or decision point that can be used to assess the student's understanding.",
+            suffix="Here is the user question: {question}",
+        ),
+        CachedPrompt(
+            "rewrite",
+            prefix="Given the original user question and the generated clinical scenario, reformulate the question in Portuguese to better target the retrieval of medical documents that provide information relevant to the medical decision or concept highlighted in the clinical scenario. The improved question should combine key elements from both the original question and the clinical scenario to ensure the retrieved documents are highly relevant.",
+            suffix="Original question: {question}\n"
+            "Clinical scenario: {clinical_scenario}",
+        ),
+        CachedPrompt(
+            "generate",
+            prefix="""Você é um professor criando uma questão de múltipla escolha para uma avaliação de conhecimento médico. Você receberá um cenário clínico, uma solicitação do usuário e um documento recuperado com informações médicas relevantes.
+
+Sua tarefa é formular uma questão em português que avalie o entendimento do aluno sobre os conceitos médicos necessários para abordar a situação descrita no cenário clínico, com base nas informações do documento recuperado.
+
+Instruções:
+1. Escreva a questão em português.
+2. O enunciado da questão deve incluir explicitamente uma quantidade considerável de detalhes relevantes do cenário clínico, como idade do paciente, sintomas, histórico médico ou resultados de exames, para fornecer contexto suficiente para que o aluno responda sem precisar consultar o cenário separadamente.
+3. Certifique-se de que a questão esteja diretamente relacionada ao conteúdo médico necessário para entender ou resolver o cenário clínico, conforme informado pela solicitação do usuário e pelo documento.
+4. Forneça cinco alternativas (A a E), com apenas uma resposta correta.
+5. Para cada alternativa, forneça explicação em português, justificando por que ela está correta ou incorreta. A explicação deve conter os conceitos médicos envolvidos na alternativa e o motivo aprofundado da justificação. Se ela for correta deve conter início: (CORRETA), caso seja incorreta deve conter início (INCORRETA)
+6. Forneça uma explicação geral da questão em português, detalhando os conceitos médicos envolvidos.
+7. Indique o objetivo de aprendizagem em português, resumindo o principal conhecimento médico que a questão está testando.
+
+Garanta que a questão seja clara, concisa e eficaz para testar o entendimento do aluno sobre os conceitos médicos relevantes.""",
+            suffix="Aqui está o cenário clínico: {clinical_scenario}\n"
+            "Aqui está a solicitação do usuário: {question}\n"
+            "Aqui está o documento recuperado: {context}",
+        ),
+        CachedPrompt(
+            "repair_question",
+            prefix="""Você revisa questões de múltipla escolha geradas para uma avaliação de conhecimento médico. A questão enviada viola regras de formato. Reescreva apenas os campos pedidos, mantendo o conteúdo dos demais campos.
+
+Regras:
+1. Exatamente cinco alternativas, com apenas uma resposta correta.
+2. Uma explicação por alternativa, na mesma ordem das alternativas.
+3. A explicação da alternativa correta começa com (CORRETA) e as demais começam com (INCORRETA).""",
+            # The context comes before the question being repaired, so repeated
+            # repairs of one question share everything up to the current attempt
+            suffix="Documento recuperado: {context}\n"
+            "Cenário clínico: {clinical_scenario}\n"
+            "Solicitação do usuário: {question}\n"
+            "Problemas encontrados:\n{problems}\n"
+            "Questão atual: {payload}",
+        ),
+    ]
+}
+
+
+def get_prompt(name: str) -> CachedPrompt:
+    """Return a registered prompt by name."""
+    return PROMPTS[name]
+
+
+def invoke_prompt(name: str, model, **variables):
+    """
+    Invoke a chat model with a registered prompt and record its cache usage.
+
+    Args:
+        name (str): The registered prompt.
+        model (ChatOpenAI): The chat model.
+        **variables: Values for the prompt's suffix.
+
+    Returns:
+        AIMessage: The model response.
+    """
+    response = model.invoke(get_prompt(name).format_messages(**variables))
+    prompt_cache_stats.record(name, response)
+    return response
+
+
+def invoke_structured_prompt(name: str, model, schema, **variables):
+    """
+    Invoke a chat model with structured output and record its cache usage.
+
+    Args:
+        name (str): The registered prompt.
+        model (ChatOpenAI): The chat model.
+        schema (BaseModel): The structured output schema.
+        **variables: Values for the prompt's suffix.
+
+    Returns:
+        BaseModel: The parsed response.
+    """
+    llm_with_tool = model.with_structured_output(schema, include_raw=True)
+    result = llm_with_tool.invoke(get_prompt(name).format_messages(**variables))
+    prompt_cache_stats.record(name, result["raw"])
+    if result["parsing_error"] is not None:
+        raise result["parsing_error"]
+    return result["parsed"]
@@ -0,0 +1,342 @@
+from contextlib import closing
+from typing import List, Optional
+from langchain_core.messages import HumanMessage
+from langchain_openai import OpenAIEmbeddings
+
+from .ai_agent import ToolConfig, create_graph
+from .question_validation import validate_question
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+
+def load_topics(path: str) -> List[str]:
+    """
+    Load a topic list from a text file (one topic per line) or a JSONL file.
+
+    JSONL lines may be plain strings or objects with a "topic", "title" or
+    "prompt" key.
+
+    Args:
+        path (str): Path to the topic list.
+
+    Returns:
+        list: The non-empty topics, in file order, without duplicates.
+    """
+    topics = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    item = item.get("topic") or item.get("title") or item.get("prompt")
+                line = str(item).strip() if item else ""
+            if line and line not in topics:
+                topics.append(line)
+    return topics
+
+
+def is_valid_question(payload) -> bool:
+    """Check that a generated question passes the local validation."""
+    return not validate_question(payload)
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> float:
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denom) if denom else 0.0
+
+
+def _to_blob(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class QuestionPool:
+    """Local store of pre-generated questions, indexed by topic embedding."""
+
+    def __init__(
+        self,
+        tool_config: ToolConfig,
+        db_path: str = "question_pool.db",
+        low_water: int = 2,
+        target_size: int = 5,
+        topic_threshold: float = 0.85,
+        dedup_threshold: float = 0.95,
+        max_attempts: int = 10,
+    ):
+        """
+        Initialize the pool and its SQLite tables.
+
+        Args:
+            tool_config (ToolConfig): Tools used by the question graph.
+            db_path (str): Path to the SQLite database holding the pool.
+            low_water (int): Unused questions per topic below which a refill starts.
+            target_size (int): Unused questions per topic a refill tops up to.
+            topic_threshold (float): Minimum cosine similarity between a prompt
+                and a pooled topic for the pool to serve it.
+            dedup_threshold (float): Cosine similarity between two enunciates
+                above which the new question is dropped as a near-duplicate.
+            max_attempts (int): Maximum graph runs per topic in one refill.
+        """
+        self.tool_config = tool_config
+        self.db_path = db_path
+        self.low_water = low_water
+        self.target_size = target_size
+        self.topic_threshold = topic_threshold
+        self.dedup_threshold = dedup_threshold
+        self.max_attempts = max_attempts
+        self._graph = None
+        self._embeddings = None
+        self._lock = threading.Lock()
+        self._refilling = set()
+        self._create_tables()
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.db_path, timeout=30))
+
+    def _create_tables(self):
+        with self._connect() as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS topics ("
+                "topic TEXT PRIMARY KEY, embedding BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, "
+                "payload TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "used INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_questions_topic_used "
+                "ON questions (topic, used)"
+            )
+
+    def _embed(self, text: str) -> np.ndarray:
+        if self._embeddings is None:
+            self._embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+        return np.asarray(self._embeddings.embed_query(text), dtype=np.float32)
+
+    def _run_graph(self, topic: str):
+        """Run the question graph once and return the parsed question, if any."""
+        if self._graph is None:
+            self._graph = create_graph(self.tool_config)
+        initial_state = {
+            "messages": [HumanMessage(content=topic)],
+            "clinical_scenario": "",
+            "tools": self.tool_config.get_tools(),
+        }
+        output = self._graph.invoke(initial_state)
+        try:
+            return json.loads(output["messages"][-1].content)
+        except (json.JSONDecodeError, AttributeError):
+            return None
+
+    def _register_topic(self, topic: str):
+        with self._connect() as conn, conn:
+            exists = conn.execute(
+                "SELECT 1 FROM topics WHERE topic = ?", (topic,)
+            ).fetchone()
+        if exists:
+            return
+        embedding = self._embed(topic)
+        with self._connect() as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO topics (topic, embedding) VALUES (?, ?)",
+                (topic, _to_blob(embedding)),
+            )
+
+    def match_topic(self, prompt: str) -> Optional[str]:
+        """
+        Find the pooled topic closest to a prompt.
+
+        A prompt that is not exactly a pooled topic costs one synchronous
+        embeddings call, which adds to the latency of every pool miss.
+
+        Args:
+            prompt (str): The user request.
+
+        Returns:
+            str: The matching topic, or None if none is similar enough.
+        """
+        prompt = prompt.strip()
+        with self._connect() as conn:
+            rows = conn.execute("SELECT topic, embedding FROM topics").fetchall()
+        if not rows:
+            return None
+        for topic, _ in rows:
+            if topic.casefold() == prompt.casefold():
+                return topic
+        query = self._embed(prompt)
+        best_topic, best_score = None, self.topic_threshold
+        for topic, blob in rows:
+            score = _cosine(query, _from_blob(blob))
+            if score >= best_score:
+                best_topic, best_score = topic, score
+        return best_topic
+
+    def unused_count(self, topic: str) -> int:
+        """Return the number of questions for a topic that were not served yet."""
+        with self._connect() as conn:
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE topic = ? AND used = 0",
+                (topic,),
+            ).fetchone()
+        return count
+
+    def _is_duplicate(self, topic: str, embedding: np.ndarray) -> bool:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT embedding FROM questions WHERE topic = ?", (topic,)
+            ).fetchall()
+        return any(
+            _cosine(embedding, _from_blob(blob)) >= self.dedup_threshold
+            for (blob,) in rows
+        )
+
+    def add_question(self, topic: str, payload: dict) -> bool:
+        """
+        Store a generated question unless it is invalid or a near-duplicate.
+
+        Args:
+            topic (str): The topic the question was generated for.
+            payload (dict): The parsed output of the `generate` node.
+
+        Returns:
+            bool: True if the question was stored.
+        """
+        if not is_valid_question(payload):
+            print(f"---POOL: INVALID QUESTION DROPPED ({topic})---")
+            return False
+        embedding = self._embed(payload["question"])
+        with self._lock:
+            if self._is_duplicate(topic, embedding):
+                print(f"---POOL: DUPLICATE QUESTION DROPPED ({topic})---")
+                return False
+            with self._connect() as conn, conn:
+                conn.execute(
+                    "INSERT INTO questions (topic, payload, embedding, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        topic,
+                        json.dumps(payload, ensure_ascii=False),
+                        _to_blob(embedding),
+                        time.time(),
+                    ),
+                )
+        return True
+
+    def fill_topic(self, topic: str):
+        """Run the graph for a topic until the pool reaches its target size."""
+        self._register_topic(topic)
+        attempts = 0
+        while (
+            self.unused_count(topic) < self.target_size and attempts < self.max_attempts
+        ):
+            attempts += 1
+            try:
+                payload = self._run_graph(topic)
+            except Exception as e:
+                print(f"---POOL: GENERATION FAILED ({topic}): {e}---")
+                continue
+            self.add_question(topic, payload)
+        print(f"---POOL: {topic} HAS {self.unused_count(topic)} QUESTIONS---")
+
+    def warm_up(self, topics: List[str]):
+        """Fill the pool for every topic of a syllabus."""
+        for topic in topics:
+            self.fill_topic(topic)
+
+    def refill_async(self, topic: str):
+        """Start a background refill of a topic if it fell below the low-water mark."""
+        if self.unused_count(topic) >= self.low_water:
+            return
+        with self._lock:
+            if topic in self._refilling:
+                return
+            self._refilling.add(topic)
+
+        def _refill():
+            try:
+                self.fill_topic(topic)
+            finally:
+                with self._lock:
+                    self._refilling.discard(topic)
+
+        threading.Thread(target=_refill, daemon=True).start()
+
+    def serve(self, prompt: str) -> Optional[dict]:
+        """
+        Take an unused pooled question matching the prompt.
+
+        The question was generated for the pooled topic, which may be broader
+        than the prompt, so the topic is returned with it under "pooled_topic".
+        See `match_topic` for the lookup cost on a miss.
+
+        Args:
+            prompt (str): The user request.
+
+        Returns:
+            dict: The question in the `generate` output format plus
+                "pooled_topic", or None if the pool has nothing for this prompt.
+        """
+        # The pool only saves time, so any failure falls back to the graph
+        try:
+            topic = self.match_topic(prompt)
+            if topic is None:
+                return None
+            row = self._take_unused(topic)
+            self.refill_async(topic)
+        except Exception as e:
+            print(f"---POOL: LOOKUP FAILED, FALLING BACK TO GRAPH: {e}---")
+            return None
+        if row is None:
+            return None
+        print(f"---POOL: SERVED QUESTION FOR {topic}---")
+        return {**json.loads(row[1]), "pooled_topic": topic}
+
+    def _take_unused(self, topic: str):
+        """Mark the oldest unused question of a topic as used and return its row."""
+        with self._lock, self._connect() as conn, conn:
+            row = conn.execute(
+                "SELECT id, payload FROM questions WHERE topic = ? AND used = 0 "
+                "ORDER BY created_at LIMIT 1",
+                (topic,),
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE questions SET used = 1 WHERE id = ?", (row[0],))
+        return row
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pre-generate questions for a list of topics."
+    )
+    parser.add_argument("topics", help="Topic list (.txt or .jsonl)")
+    parser.add_argument("--document-path", default="")
+    parser.add_argument(
+        "--db-path", default=os.getenv("QUESTION_POOL_DB", "question_pool.db")
+    )
+    parser.add_argument("--target-size", type=int, default=5)
+    args = parser.parse_args()
+
+    pool = QuestionPool(
+        ToolConfig(args.document_path),
+        db_path=args.db_path,
+        target_size=args.target_size,
+    )
+    pool.warm_up(load_topics(args.topics))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+from uuid import uuid4
+
+from langchain_core.messages import ToolMessage
+from pydantic import BaseModel, Field
+
+import json
+import os
+import threading
+import time
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+class StoredQuestion(BaseModel):
+    """A generated question as kept in a question bank."""
+
+    id: str = Field(default_factory=lambda: str(uuid4()))
+    topic: str = ""
+    question: str
+    alternatives: List[str]
+    alt_explanations: List[str]
+    question_explanation: str
+    learning_objective: str
+    source_chunk_ids: List[str] = Field(default_factory=list)
+    metrics: Dict[str, float] = Field(default_factory=dict)
+    created_at: float = Field(default_factory=time.time)
+
+
+QUESTION_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("topic", pa.string()),
+        ("question", pa.string()),
+        ("alternatives", pa.list_(pa.string())),
+        ("alt_explanations", pa.list_(pa.string())),
+        ("question_explanation", pa.string()),
+        ("learning_objective", pa.string()),
+        ("source_chunk_ids", pa.list_(pa.string())),
+        ("metrics", pa.map_(pa.string(), pa.float64())),
+        ("created_at", pa.float64()),
+    ]
+)
+
+
+def question_from_output(topic: str, output, latency_s: float) -> StoredQuestion:
+    """
+    Build a StoredQuestion from the final state of the question graph.
+
+    Args:
+        topic (str): The user request the graph was run with.
+        output (dict): The state returned by `graph.invoke`.
+        latency_s (float): Wall-clock time of the graph run.
+
+    Returns:
+        StoredQuestion: The question with its generation metrics.
+
+    Raises:
+        ValueError: If the question is still invalid after the repair calls.
+    """
+    messages = output["messages"]
+    payload = json.loads(messages[-1].content)
+    if payload.get("validation_errors"):
+        raise ValueError(f"Question failed validation: {payload['validation_errors']}")
+    retrievals = sum(isinstance(message, ToolMessage) for message in messages)
+    return StoredQuestion(
+        topic=topic,
+        metrics={"latency_s": latency_s, "retrievals": float(retrievals)},
+        **payload,
+    )
+
+
+def write_question_output(writer, topic: str, output, latency_s: float) -> bool:
+    """
+    Write the question of a graph run to a bank unless it failed validation.
+
+    Args:
+        writer: A JSONL or Parquet question writer.
+        topic (str): The user request the graph was run with.
+        output (dict): The state returned by `graph.invoke`.
+        latency_s (float): Wall-clock time of the graph run.
+
+    Returns:
+        bool: True if the question was written.
+    """
+    try:
+        question = question_from_output(topic, output, latency_s)
+    except ValueError as e:
+        print(f"---BANK: QUESTION NOT STORED: {e}---")
+        return False
+    writer.write(question)
+    return True
+
+
+class JsonlQuestionWriter:
+    """Append-only JSONL writer, safe to share between threads and processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write(self, question: StoredQuestion):
+        """Append one question as a single line."""
+        line = (question.model_dump_json() + "\n").encode("utf-8")
+        # One write per line on an O_APPEND descriptor keeps lines from interleaving
+        with self._lock:
+            os.write(self._fd, line)
+
+    def close(self):
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetQuestionWriter:
+    """
+    Append-only Parquet writer.
+
+    Each writer owns its own part file inside the bank directory, so concurrent
+    workers never write to the same file. Rows are buffered and flushed as row
+    groups, and the part becomes visible to readers once the writer is closed.
+    A writer that is never closed loses its rows, so use it for batch jobs as a
+    context manager, and JsonlQuestionWriter for long-lived processes.
+    """
+
+    def __init__(self, directory: str, row_group_size: int = 256):
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{uuid4().hex}.parquet"
+        self.path = os.path.join(directory, name)
+        # Readers skip "_"-prefixed files, so unfinished parts stay invisible
+        self._tmp_path = os.path.join(directory, f"_{name}")
+        self.row_group_size = row_group_size
+        self._lock = threading.Lock()
+        self._buffer: List[dict] = []
+        self._writer = pq.ParquetWriter(self._tmp_path, QUESTION_SCHEMA)
+
+    def write(self, question: StoredQuestion):
+        """Buffer one question, flushing a row group when the buffer is full."""
+        with self._lock:
+            self._buffer.append(question.model_dump())
+            if len(self._buffer) >= self.row_group_size:
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            table = pa.Table.from_pylist(self._buffer, schema=QUESTION_SCHEMA)
+            self._writer.write_table(table)
+            self._buffer = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._writer.close()
+            os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_question_writer(path: str):
+    """Open a JSONL writer for `.jsonl` paths and a Parquet writer otherwise."""
+    if path.endswith(".jsonl"):
+        return JsonlQuestionWriter(path)
+    return ParquetQuestionWriter(path)
+
+
+def _iter_jsonl(path, topic, learning_objective):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if topic is not None and row.get("topic") != topic:
+                continue
+            if (
+                learning_objective is not None
+                and row.get("learning_objective") != learning_objective
+            ):
+                continue
+            yield row
+
+
+def _iter_parquet(path, topic, learning_objective, columns):
+    dataset = ds.dataset(path, format="parquet", schema=QUESTION_SCHEMA)
+    expression = None
+    if topic is not None:
+        expression = ds.field("topic") == topic
+    if learning_objective is not None:
+        clause = ds.field("learning_objective") == learning_objective
+        expression = clause if expression is None else expression & clause
+    for batch in dataset.to_batches(columns=columns, filter=expression):
+        for row in batch.to_pylist():
+            if "metrics" in row and row["metrics"] is not None:
+                row["metrics"] = dict(row["metrics"])
+            yield row
+
+
+def iter_questions(
+    path: str,
+    topic: Optional[str] = None,
+    learning_objective: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> Iterator[dict]:
+    """
+    Stream the questions of a bank, optionally filtered.
+
+    Parquet banks push the filter and column selection down into the scan, so
+    only matching row groups and the requested columns are read.
+
+    Args:
+        path (str): A `.jsonl` file or a Parquet bank directory.
+        topic (str): Only yield questions generated for this topic.
+        learning_objective (str): Only yield questions with this learning objective.
+        columns (list): Columns to read. Defaults to every column.
+
+    Returns:
+        Iterator[dict]: The matching questions, one dict per question.
+    """
+    if path.endswith(".jsonl"):
+        rows = _iter_jsonl(path, topic, learning_objective)
+        if columns is None:
+            return rows
+        return ({key: row.get(key) for key in columns} for row in rows)
+    return _iter_parquet(path, topic, learning_objective, columns)
+
+
+def assemble_exam(
+    path: str,
+    size: int,
+    topic: Optional[str] = None,
+    learning_objective: Optional[str] = None,
+) -> List[dict]:
+    """
+    Take the first `size` matching questions of a bank without reading the rest.
+
+    Args:
+        path (str): A `.jsonl` file or a Parquet bank directory.
+        size (int): Number of questions in the exam.
+        topic (str): Only use questions generated for this topic.
+        learning_objective (str): Only use questions with this learning objective.
+
+    Returns:
+        list: The exam questions.
+    """
+    rows = iter_questions(path, topic=topic, learning_objective=learning_objective)
+    return list(islice(rows, size))
@@ -0,0 +1,111 @@
+from typing import Dict
+
+import threading
+
+REQUIRED_FIELDS = (
+    "question",
+    "alternatives",
+    "alt_explanations",
+    "question_explanation",
+    "learning_objective",
+)
+NUM_ALTERNATIVES = 5
+CORRECT_MARKER = "(CORRETA)"
+INCORRECT_MARKER = "(INCORRETA)"
+
+
+def validate_question(payload) -> Dict[str, str]:
+    """
+    Check the invariants of a generated question locally.
+
+    Args:
+        payload (dict): The parsed output of the `generate` node.
+
+    Returns:
+        dict: Broken field mapped to what is wrong with it. Empty if the
+            question is valid.
+    """
+    if not isinstance(payload, dict):
+        return {field: "missing" for field in REQUIRED_FIELDS}
+
+    errors = {}
+    for field in REQUIRED_FIELDS:
+        if not payload.get(field):
+            errors[field] = "missing or empty"
+
+    alternatives = payload.get("alternatives") or []
+    alt_explanations = payload.get("alt_explanations") or []
+    if alternatives and len(alternatives) != NUM_ALTERNATIVES:
+        errors["alternatives"] = (
+            f"has {len(alternatives)} items, expected {NUM_ALTERNATIVES}"
+        )
+    if alt_explanations and len(alt_explanations) != NUM_ALTERNATIVES:
+        errors["alt_explanations"] = (
+            f"has {len(alt_explanations)} items, expected one per alternative "
+            f"({NUM_ALTERNATIVES})"
+        )
+    elif alt_explanations:
+        markers = [exp.strip() for exp in alt_explanations]
+        unmarked = [
+            i
+            for i, exp in enumerate(markers)
+            if not exp.startswith((CORRECT_MARKER, INCORRECT_MARKER))
+        ]
+        correct = [i for i, exp in enumerate(markers) if exp.startswith(CORRECT_MARKER)]
+        if len(correct) != 1:
+            errors["alt_explanations"] = (
+                f"has {len(correct)} explanations starting with {CORRECT_MARKER}, "
+                "expected exactly one"
+            )
+        elif unmarked:
+            errors["alt_explanations"] = (
+                f"explanations {unmarked} do not start with {CORRECT_MARKER} "
+                f"or {INCORRECT_MARKER}"
+            )
+    return errors
+
+
+class ValidationStats:
+    """Thread-safe counters of validation outcomes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checked = 0
+            self.passed = 0
+            self.repaired = 0
+            self.failed = 0
+            self.repair_calls = 0
+
+    def record(self, outcome: str, repair_calls: int = 0):
+        """
+        Record the outcome of one validation stage.
+
+        Args:
+            outcome (str): "passed", "repaired" or "failed".
+            repair_calls (int): Number of repair calls issued for the question.
+        """
+        with self._lock:
+            self.checked += 1
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.repair_calls += repair_calls
+
+    def report(self) -> Dict[str, float]:
+        """Return the counters with the repair and failure rates."""
+        with self._lock:
+            checked = self.checked or 1
+            return {
+                "checked": self.checked,
+                "passed": self.passed,
+                "repaired": self.repaired,
+                "failed": self.failed,
+                "repair_calls": self.repair_calls,
+                "repair_rate": self.repaired / checked,
+                "failure_rate": self.failed / checked,
+            }
+
+
+validation_stats = ValidationStats()
@@ -2,11 +2,15 @@ from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from langchain.tools.retriever import create_retriever_tool
 from pinecone import Pinecone
+from collections import defaultdict
+import json
 import os
 from uuid import uuid4
 
 
-def create_vectorstore(docs_split, index_name="medical-documents"):
+def create_vectorstore(
+    docs_split, index_name="medical-documents", metadata_index_path=None
+):
     """
     Create or load a persistent Chroma vector store.
 
@@ -14,6 +18,8 @@ def create_vectorstore(docs_split, index_name="medical-documents"):
         docs_split: List of split documents to store.
         persist: Boolean to indicate if the vector store should be persisted.
         persist_directory: Directory where the vector store is saved/loaded.
+        metadata_index_path: Where to save the MetadataIndex of the uploaded
+            chunks, so retrieval scopes reflect what the index actually holds.
 
     Returns:
         Chroma: The loaded or newly created vector store.
@@ -42,6 +48,8 @@ def create_vectorstore(docs_split, index_name="medical-documents"):
         print(f"Populating Pinecone index '{index_name}' with documents.")
         vectorstore = PineconeVectorStore(index=index, embedding=embedding_function)
         vectorstore.add_documents(documents=docs_split, ids=uuids)
+        if metadata_index_path:
+            MetadataIndex(docs_split).save(metadata_index_path)
     else:
         print(f"Loading existing Pinecone index '{index_name}'.")
         vectorstore = PineconeVectorStore.from_existing_index(
@@ -51,10 +59,130 @@ def create_vectorstore(docs_split, index_name="medical-documents"):
     return vectorstore
 
 
-def create_vectorstore_retriever(vectorstore):
-    """Create a retriever from the vector store."""
+class MetadataIndex:
+    """Inverted index from chunk metadata values to chunk positions."""
+
+    def __init__(self, docs_split=None, keys=("source", "specialty", "author", "page")):
+        """
+        Index the metadata of the given chunks.
+
+        Args:
+            docs_split (list): Document chunks from split_text.
+            keys (tuple): Metadata keys to index.
+        """
+        self.keys = keys
+        self.size = 0
+        self.postings = {key: defaultdict(set) for key in keys}
+        self.add(docs_split or [])
+
+    def add(self, docs_split):
+        """Index more chunks, positioned after the ones already indexed."""
+        for position, chunk in enumerate(docs_split, start=self.size):
+            for key in self.keys:
+                if key in chunk.metadata:
+                    self.postings[key][chunk.metadata[key]].add(position)
+        self.size += len(docs_split)
+
+    def save(self, path):
+        """Write the index to a JSON file."""
+        data = {
+            "size": self.size,
+            "postings": {
+                key: [[value, sorted(positions)] for value, positions in values.items()]
+                for key, values in self.postings.items()
+            },
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, keys=("source", "specialty", "author", "page")):
+        """
+        Read an index saved with `save`.
+
+        Args:
+            path (str): The JSON file.
+            keys (tuple): Metadata keys to index.
+
+        Returns:
+            MetadataIndex: The saved index, or an empty one if the file is missing.
+        """
+        index = cls(keys=keys)
+        if not os.path.exists(path):
+            return index
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index.size = data["size"]
+        for key, values in data["postings"].items():
+            if key in index.postings:
+                for value, positions in values:
+                    index.postings[key][value] = set(positions)
+        return index
+
+    def values(self, key):
+        """Return the sorted distinct values of a metadata key."""
+        return sorted(self.postings.get(key, {}), key=str)
+
+    def candidates(self, metadata_filter):
+        """
+        Return the positions of the chunks matching a metadata filter.
+
+        Values of one key are OR-ed and different keys are AND-ed.
+
+        Args:
+            metadata_filter (dict): Metadata key mapped to the allowed values.
+
+        Returns:
+            set: Positions of the matching chunks.
+        """
+        result = set(range(self.size))
+        for key, allowed in metadata_filter.items():
+            postings = self.postings.get(key, {})
+            matched = set()
+            for value in allowed:
+                matched |= postings.get(value, set())
+            result &= matched
+            if not result:
+                break
+        return result
+
+
+def build_metadata_filter(metadata_filter):
+    """
+    Convert a {key: [values]} selection into a Pinecone metadata filter.
+
+    Args:
+        metadata_filter (dict): Metadata key mapped to the allowed values.
+
+    Returns:
+        dict: The Pinecone filter, or None if nothing is selected.
+    """
+    clauses = {
+        key: {"$in": list(values)}
+        for key, values in (metadata_filter or {}).items()
+        if values
+    }
+    return clauses or None
+
 
-    retriever = vectorstore.as_retriever()
+def create_vectorstore_retriever(vectorstore, metadata_filter=None):
+    """
+    Create a retriever from the vector store.
+
+    Args:
+        vectorstore (PineconeVectorStore): The vector store to search.
+        metadata_filter (dict): Optional metadata key mapped to the allowed values.
+            The filter is pushed down into the vector search so only matching
+            chunks are scored.
+
+    Returns:
+        VectorStoreRetriever: The retriever.
+    """
+    search_kwargs = {}
+    pinecone_filter = build_metadata_filter(metadata_filter)
+    if pinecone_filter:
+        search_kwargs["filter"] = pinecone_filter
+    retriever = vectorstore.as_retriever(search_kwargs=search_kwargs)
     print("Retriever created successfully!")
 
     return retriever
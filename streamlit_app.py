@@ -1,16 +1,41 @@
 import streamlit as st
 from langchain_core.messages import HumanMessage
 from quest_generation.ai_agent import create_graph, ToolConfig
+from quest_generation.prompts import prompt_cache_stats
+from quest_generation.question_bank import QuestionPool
+from quest_generation.question_store import JsonlQuestionWriter, write_question_output
+from quest_generation.question_validation import validation_stats
 import requests
 import ast
 import json
 import dotenv
 import os
+import time
 
 dotenv.load_dotenv()
 CORRECT_PASSWORD = os.getenv("APP_PASSWORD")
+QUESTION_BANK_PATH = os.getenv("QUESTION_BANK_PATH", "question_bank.jsonl")
+# A cached writer is never closed, and Parquet parts are only published on close
+if not QUESTION_BANK_PATH.endswith(".jsonl"):
+    raise ValueError("QUESTION_BANK_PATH must be a .jsonl file.")
 
-tool_config = ToolConfig()
+tool_config = ToolConfig(
+    metadata_index_path=os.getenv("METADATA_INDEX_PATH", "metadata_index.json")
+)
+
+
+@st.cache_resource
+def get_question_pool():
+    """Shared pool of pre-generated questions, kept across reruns."""
+    return QuestionPool(
+        tool_config, db_path=os.getenv("QUESTION_POOL_DB", "question_pool.db")
+    )
+
+
+@st.cache_resource
+def get_question_writer():
+    """Shared append-only writer for the question bank, kept across reruns."""
+    return JsonlQuestionWriter(QUESTION_BANK_PATH)
 
 
 def check_password():
@@ -37,17 +62,46 @@ def check_password():
     return True
 
 
+def select_metadata_filter():
+    """Sidebar widgets to scope retrieval to stored guidelines or specialties."""
+    metadata_filter = {}
+    for key, label in (("source", "Diretrizes"), ("specialty", "Especialidades")):
+        # Only scopes recorded when the vector store was populated are offered
+        options = tool_config.metadata_index.values(key)
+        if options:
+            selected = st.sidebar.multiselect(label, options, key=f"filter_{key}")
+            if selected:
+                metadata_filter[key] = selected
+    return metadata_filter
+
+
 # Function to generate a question using the Flask API
-def generate_question(prompt):
+def generate_question(prompt, metadata_filter=None):
+    tool_config.set_metadata_filter(metadata_filter)
+    # Serve a pre-generated question when the pool covers this topic
+    if not metadata_filter:
+        pooled = get_question_pool().serve(prompt)
+        if pooled:
+            return pooled
+
     graph = create_graph(tool_config)
     initial_state = {
         "messages": [HumanMessage(content=prompt)],
         "clinical_scenario": "",
         "tools": tool_config.get_tools(),  # Pass tools into the initial state
     }
+    start = time.perf_counter()
     output = graph.invoke(initial_state)
 
     response = json.loads(output["messages"][-1].content)
+    # Keep every valid generated question in the bank, beyond the session.
+    # The bank is a side effect, so a failed write must not lose the question.
+    try:
+        write_question_output(
+            get_question_writer(), prompt, output, time.perf_counter() - start
+        )
+    except OSError as e:
+        print(f"---BANK: WRITE FAILED: {e}---")
 
     return response
 
@@ -77,11 +131,29 @@ if check_password():
         height=150,
         key="user_prompt",
     )
+    metadata_filter = select_metadata_filter()
 
     # Button to generate response
     if st.button("Gerar Questão"):
         if user_prompt:
-            response = generate_question(user_prompt)
+            try:
+                response = generate_question(user_prompt, metadata_filter)
+            except ValueError as e:
+                st.error(str(e))
+                response = None
+            if response and response.get("pooled_topic"):
+                st.info(
+                    "Questão pré-gerada para o tema "
+                    f"“{response['pooled_topic']}”, próximo da sua solicitação."
+                )
+            if response and response.get("validation_errors"):
+                st.warning(
+                    "A questão gerada não passou na validação: "
+                    + "; ".join(
+                        f"{field}: {problem}"
+                        for field, problem in response["validation_errors"].items()
+                    )
+                )
             if response:
                 # Access the JSON structure using keys
                 st.session_state["question"] = response["question"]
@@ -148,6 +220,26 @@ if check_password():
             st.session_state["edit_question"] = False
             st.rerun()
 
+    # Repair and failure rates of the validation stage in this server process
+    report = validation_stats.report()
+    if report["checked"]:
+        st.sidebar.markdown("### Validação")
+        st.sidebar.write(
+            f"{report['checked']} questões verificadas, "
+            f"{report['repair_rate']:.0%} reparadas, "
+            f"{report['failure_rate']:.0%} com falha"
+        )
+
+    # Share of input tokens served from the provider's prompt cache, per node
+    cache_report = prompt_cache_stats.report()
+    if cache_report:
+        st.sidebar.markdown("### Cache de prompts")
+        for name, stats in cache_report.items():
+            st.sidebar.write(
+                f"{name}: {stats['cache_hit_rate']:.0%} de "
+                f"{stats['input_tokens']} tokens de entrada em cache"
+            )
+
     # Optional: Add some instructions or info
     st.sidebar.markdown(
         """
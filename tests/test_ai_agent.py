@@ -1,6 +1,11 @@
 import pytest
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
 from langchain_core.messages import HumanMessage
+from langchain_core.vectorstores import InMemoryVectorStore
+from quest_generation import ai_agent
 from quest_generation.ai_agent import create_graph, ToolConfig
+from quest_generation.vectorstore_utils import MetadataIndex
 from quest_generation.env_utils import load_env
 
 
@@ -86,5 +91,77 @@ def test_generate_question(tool_config):
     ), "Generated question does not contain 'content'."
 
 
+@pytest.fixture
+def offline_tool_config(monkeypatch, tmp_path):
+    """Fixture building ToolConfig from in-memory chunks instead of Pinecone."""
+
+    def make(stored_chunks, local_chunks=None):
+        index_path = str(tmp_path / "metadata_index.json")
+        if stored_chunks is not None:
+            # What create_vectorstore saved when it populated the vector store
+            MetadataIndex(stored_chunks).save(index_path)
+        monkeypatch.setattr(ai_agent, "load_documents", lambda path: local_chunks)
+        monkeypatch.setattr(ai_agent, "split_text", lambda docs, **kwargs: docs)
+        monkeypatch.setattr(
+            ai_agent,
+            "create_vectorstore",
+            lambda docs, **kwargs: InMemoryVectorStore(
+                DeterministicFakeEmbedding(size=8)
+            ),
+        )
+        return ToolConfig(metadata_index_path=index_path)
+
+    return make
+
+
+def retriever_search_kwargs(tool_config):
+    return tool_config.get_tools()[0].func.keywords["retriever"].search_kwargs
+
+
+def test_set_metadata_filter(offline_tool_config):
+    """Test if a filter matching stored chunks is pushed into the retriever."""
+    tool_config = offline_tool_config(
+        [
+            Document(
+                page_content="a",
+                metadata={"source": "hta.pdf", "specialty": "cardiologia"},
+            ),
+            Document(
+                page_content="b",
+                metadata={"source": "dm.pdf", "specialty": "endocrinologia"},
+            ),
+        ]
+    )
+    assert retriever_search_kwargs(tool_config) == {}
+    tool_config.set_metadata_filter({"specialty": ["cardiologia"]})
+    assert retriever_search_kwargs(tool_config) == {
+        "filter": {"specialty": {"$in": ["cardiologia"]}}
+    }
+    tool_config.set_metadata_filter(None)
+    assert retriever_search_kwargs(tool_config) == {}
+
+
+def test_set_metadata_filter_rejects_unmatched(offline_tool_config):
+    """Test if filters that would retrieve nothing fail fast."""
+    tool_config = offline_tool_config(
+        [Document(page_content="a", metadata={"source": "hta.pdf"})]
+    )
+    with pytest.raises(ValueError):
+        tool_config.set_metadata_filter({"source": ["dm.pdf"]})
+    with pytest.raises(ValueError):
+        tool_config.set_metadata_filter({"chunk_id": ["x-0"]})
+    assert tool_config.metadata_filter is None
+
+
+def test_set_metadata_filter_checks_stored_chunks(offline_tool_config):
+    """Test if scopes come from the stored chunks, not the local documents."""
+    local = [Document(page_content="a", metadata={"source": "local.pdf"})]
+    tool_config = offline_tool_config(None, local_chunks=local)
+    assert tool_config.metadata_index.values("source") == []
+    with pytest.raises(ValueError):
+        tool_config.set_metadata_filter({"source": ["local.pdf"]})
+    tool_config.set_metadata_filter({})
+
+
 if __name__ == "__main__":
     pytest.main()
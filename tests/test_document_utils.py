@@ -0,0 +1,22 @@
+import fitz
+import pytest
+from quest_generation.document_utils import load_documents
+
+
+def test_load_documents_normalizes_metadata(tmp_path):
+    """Test if pages get the file name as source and the folder as specialty."""
+    folder = tmp_path / "cardiologia"
+    folder.mkdir()
+    path = str(folder / "hipertensao.pdf")
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), "Hipertensão arterial")
+    pdf.save(path)
+
+    docs = load_documents(path)
+    assert docs[0].metadata["source"] == "hipertensao.pdf"
+    assert docs[0].metadata["specialty"] == "cardiologia"
+    assert docs[0].metadata["file_path"] == path
+
+
+if __name__ == "__main__":
+    pytest.main()
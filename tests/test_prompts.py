@@ -0,0 +1,121 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from quest_generation import ai_agent
+from quest_generation.prompts import PROMPTS, prompt_cache_stats
+
+
+class StubChatModel:
+    """Stand-in for ChatOpenAI that records the prompts it receives."""
+
+    calls = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    def _respond(self, messages):
+        StubChatModel.calls.append(messages)
+        return AIMessage(
+            content="resposta",
+            usage_metadata={
+                "input_tokens": 2048,
+                "output_tokens": 10,
+                "total_tokens": 2058,
+                "input_token_details": {"cache_read": 1024},
+            },
+        )
+
+    def invoke(self, messages):
+        return self._respond(messages)
+
+    def with_structured_output(self, schema, include_raw=False):
+        stub = self
+
+        class Structured:
+            def invoke(self, messages):
+                raw = stub._respond(messages)
+                if schema is ai_agent.grade:
+                    parsed = schema(binary_score="yes")
+                else:
+                    parsed = schema(
+                        enunciate="Qual o tratamento?",
+                        alternatives=["A", "B", "C", "D", "E"],
+                        alt_explanations=["(CORRETA) a"] + ["(INCORRETA) b"] * 4,
+                        question_explanation="Explicação",
+                        learning_objective="Objetivo",
+                    )
+                return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+        return Structured()
+
+
+@pytest.fixture(autouse=True)
+def stub_model(monkeypatch):
+    """Fixture replacing the chat model with the stub."""
+    monkeypatch.setattr(ai_agent, "ChatOpenAI", StubChatModel)
+    StubChatModel.calls = []
+    prompt_cache_stats.reset()
+
+
+def make_state(question, scenario, docs):
+    return {
+        "messages": [
+            HumanMessage(content=question),
+            ToolMessage(content=docs, tool_call_id="1"),
+        ],
+        "clinical_scenario": scenario,
+        "tools": [],
+    }
+
+
+@pytest.mark.parametrize(
+    "node", [ai_agent.create_clinical_scenario, ai_agent.rewrite, ai_agent.generate]
+)
+def test_prefix_is_byte_identical(node):
+    """Test if the leading instructions do not change with the request."""
+    node(make_state("Tratamento da hipertensão", "Paciente de 45 anos", "doc 1"))
+    node(make_state("Diagnóstico de diabetes {x}", "Paciente de 60 anos", "doc 2"))
+    first, second = StubChatModel.calls
+    assert first[0].content.encode("utf-8") == second[0].content.encode("utf-8")
+    assert first[-1].content != second[-1].content
+    assert "hipertensão" not in first[0].content
+
+
+def test_grade_prefix_is_byte_identical():
+    """Test if the grader prefix does not change with the request."""
+    ai_agent.grade_documents(make_state("Hipertensão", "", "doc 1"))
+    ai_agent.grade_documents(make_state("Diabetes", "", "doc 2"))
+    first, second = StubChatModel.calls
+    assert first[0].content.encode("utf-8") == second[0].content.encode("utf-8")
+
+
+def test_variables_come_last():
+    """Test if every variable is filled in the final message only."""
+    for prompt in PROMPTS.values():
+        names = prompt.template.input_variables
+        messages = prompt.format_messages(**{name: f"<{name}>" for name in names})
+        assert messages[0].content == prompt.prefix
+        for name in names:
+            assert f"<{name}>" not in messages[0].content
+            assert f"<{name}>" in messages[-1].content
+
+
+def test_cached_tokens_are_recorded(capsys):
+    """Test if cached-token counts from the responses are accumulated and logged."""
+    state = make_state("Tratamento da hipertensão", "Paciente", "doc")
+    ai_agent.create_clinical_scenario(state)
+    ai_agent.create_clinical_scenario(state)
+    output = ai_agent.generate(state)
+    assert json.loads(output["messages"][0]["content"])["question"]
+    report = prompt_cache_stats.report()
+    assert report["create_clinical_scenario"]["calls"] == 2
+    assert report["create_clinical_scenario"]["cached_tokens"] == 2048
+    assert report["generate"]["cache_hit_rate"] == 0.5
+    assert "---PROMPT CACHE: generate 1024/2048 input tokens cached---" in (
+        capsys.readouterr().out
+    )
+
+
+if __name__ == "__main__":
+    pytest.main()
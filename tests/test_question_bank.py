@@ -0,0 +1,116 @@
+import threading
+
+import numpy as np
+import pytest
+from quest_generation.question_bank import QuestionPool
+
+TOPIC_VECTORS = {
+    "hipertensão": [1.0, 0.0, 0.0],
+    "diabetes": [0.0, 1.0, 0.0],
+    "tratamento da pressão alta": [0.95, 0.05, 0.0],
+    "fratura de fêmur": [0.0, 0.0, 1.0],
+}
+
+
+def make_payload(enunciate):
+    return {
+        "question": enunciate,
+        "alternatives": ["A", "B", "C", "D", "E"],
+        "alt_explanations": ["(CORRETA) a"] + ["(INCORRETA) b"] * 4,
+        "question_explanation": "Explicação",
+        "learning_objective": "Objetivo",
+    }
+
+
+def fake_embed(text):
+    """Embed known topics to fixed vectors and questions by their trailing digit."""
+    if text in TOPIC_VECTORS:
+        return np.asarray(TOPIC_VECTORS[text], dtype=np.float32)
+    vector = np.zeros(10, dtype=np.float32)
+    vector[int(text[-1])] = 1.0
+    return vector
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """Fixture with an empty pool whose embeddings and graph are stubbed."""
+    pool = QuestionPool(None, db_path=str(tmp_path / "pool.db"), low_water=2)
+    pool._embed = fake_embed
+    pool._run_graph = lambda topic: None
+    pool._register_topic("hipertensão")
+    pool._register_topic("diabetes")
+    return pool
+
+
+def test_match_topic(pool):
+    """Test if topics are matched exactly first, then by embedding."""
+    assert pool.match_topic("  Hipertensão ") == "hipertensão"
+    assert pool.match_topic("tratamento da pressão alta") == "hipertensão"
+    assert pool.match_topic("fratura de fêmur") is None
+
+
+def test_served_question_is_marked_used(pool, monkeypatch):
+    """Test if a served question is not served again."""
+    monkeypatch.setattr(pool, "refill_async", lambda topic: None)
+    assert pool.add_question("hipertensão", make_payload("Questão 1"))
+    assert pool.unused_count("hipertensão") == 1
+    served = pool.serve("tratamento da pressão alta")
+    assert served["question"] == "Questão 1"
+    assert served["pooled_topic"] == "hipertensão"
+    assert pool.unused_count("hipertensão") == 0
+    assert pool.serve("hipertensão") is None
+
+
+def test_duplicate_question_dropped(pool):
+    """Test if a question too similar to a pooled one is dropped."""
+    assert pool.add_question("hipertensão", make_payload("Questão 1"))
+    assert not pool.add_question("hipertensão", make_payload("Outra questão 1"))
+    assert pool.add_question("hipertensão", make_payload("Questão 2"))
+    assert pool.unused_count("hipertensão") == 2
+
+
+def test_invalid_question_rejected(pool):
+    """Test if a question failing validation is not pooled."""
+    payload = make_payload("Questão 1")
+    payload["alternatives"] = ["A", "B", "C", "D"]
+    assert not pool.add_question("hipertensão", payload)
+    assert not pool.add_question("hipertensão", None)
+    assert pool.unused_count("hipertensão") == 0
+
+
+def test_refill_async_below_low_water_only_once(pool, monkeypatch):
+    """Test if a refill starts below the low-water mark, once per topic."""
+    started = []
+    release = threading.Event()
+
+    def fake_fill(topic):
+        started.append(topic)
+        release.wait(5)
+
+    monkeypatch.setattr(pool, "fill_topic", fake_fill)
+    pool.add_question("diabetes", make_payload("Questão 1"))
+    pool.add_question("diabetes", make_payload("Questão 2"))
+    pool.refill_async("diabetes")
+    assert started == []
+
+    pool.refill_async("hipertensão")
+    pool.refill_async("hipertensão")
+    release.set()
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and thread.daemon:
+            thread.join(5)
+    assert started == ["hipertensão"]
+
+
+def test_serve_falls_back_on_failure(pool):
+    """Test if a failing lookup returns nothing instead of raising."""
+
+    def broken_embed(text):
+        raise RuntimeError("embeddings unavailable")
+
+    pool._embed = broken_embed
+    assert pool.serve("tratamento da pressão alta") is None
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,120 @@
+import json
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from quest_generation.question_store import (
+    StoredQuestion,
+    assemble_exam,
+    iter_questions,
+    open_question_writer,
+    question_from_output,
+    write_question_output,
+)
+
+
+def make_question(topic, index):
+    return StoredQuestion(
+        topic=topic,
+        question=f"Questão {index} sobre {topic}?",
+        alternatives=["A", "B", "C", "D", "E"],
+        alt_explanations=["(CORRETA) a", "(INCORRETA) b", "c", "d", "e"],
+        question_explanation="Explicação",
+        learning_objective=f"Objetivo {index % 2}",
+        source_chunk_ids=[f"chunk-{index}"],
+        metrics={"latency_s": 1.5},
+    )
+
+
+@pytest.fixture(params=["bank.jsonl", "bank_parquet"])
+def bank_path(request, tmp_path):
+    """Fixture with a JSONL and a Parquet bank of ten questions over two topics."""
+    path = str(tmp_path / request.param)
+    with open_question_writer(path) as writer:
+        for i in range(10):
+            writer.write(make_question("hipertensão" if i < 6 else "diabetes", i))
+    return path
+
+
+def test_roundtrip(bank_path):
+    """Test if every stored field is read back."""
+    rows = list(iter_questions(bank_path))
+    assert len(rows) == 10
+    assert StoredQuestion(**rows[0]) == make_question("hipertensão", 0).model_copy(
+        update={"id": rows[0]["id"], "created_at": rows[0]["created_at"]}
+    )
+
+
+def test_filtered_scan(bank_path):
+    """Test if scans filter by topic and learning objective."""
+    assert len(list(iter_questions(bank_path, topic="diabetes"))) == 4
+    rows = list(
+        iter_questions(
+            bank_path,
+            topic="hipertensão",
+            learning_objective="Objetivo 0",
+            columns=["question"],
+        )
+    )
+    assert [row["question"] for row in rows] == [
+        "Questão 0 sobre hipertensão?",
+        "Questão 2 sobre hipertensão?",
+        "Questão 4 sobre hipertensão?",
+    ]
+
+
+def test_assemble_exam(bank_path):
+    """Test if an exam takes only the requested number of questions."""
+    assert len(assemble_exam(bank_path, 3, topic="hipertensão")) == 3
+    assert len(assemble_exam(bank_path, 100)) == 10
+
+
+def test_concurrent_jsonl_writers(tmp_path):
+    """Test if concurrent writers append whole lines."""
+    path = str(tmp_path / "bank.jsonl")
+
+    def worker(topic):
+        with open_question_writer(path) as writer:
+            for i in range(50):
+                writer.write(make_question(topic, i))
+
+    threads = [threading.Thread(target=worker, args=(f"t{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(list(iter_questions(path))) == 200
+
+
+def test_invalid_question_not_written(tmp_path):
+    """Test if a question still invalid after repair never reaches the bank."""
+    path = str(tmp_path / "bank.jsonl")
+    payload = make_question("hipertensão", 0).model_dump(
+        include={
+            "question",
+            "alternatives",
+            "alt_explanations",
+            "question_explanation",
+            "learning_objective",
+        }
+    )
+    valid = {"messages": [HumanMessage(content="p"), AIMessage(json.dumps(payload))]}
+    invalid_payload = {
+        **payload,
+        "alternatives": ["A", "B", "C", "D"],
+        "validation_errors": {"alternatives": "has 4 items, expected 5"},
+    }
+    invalid = {
+        "messages": [HumanMessage(content="p"), AIMessage(json.dumps(invalid_payload))]
+    }
+    with pytest.raises(ValueError):
+        question_from_output("hipertensão", invalid, 1.0)
+    with open_question_writer(path) as writer:
+        assert not write_question_output(writer, "hipertensão", invalid, 1.0)
+        assert write_question_output(writer, "hipertensão", valid, 1.0)
+    rows = assemble_exam(path, 10)
+    assert [row["alternatives"] for row in rows] == [["A", "B", "C", "D", "E"]]
+
+
+if __name__ == "__main__":
+    pytest.main()
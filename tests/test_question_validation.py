@@ -0,0 +1,139 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from quest_generation import ai_agent
+from quest_generation.question_validation import ValidationStats, validate_question
+
+
+@pytest.fixture
+def payload():
+    """Fixture with a valid generated question."""
+    return {
+        "question": "Qual o tratamento inicial?",
+        "alternatives": ["A", "B", "C", "D", "E"],
+        "alt_explanations": [
+            "(INCORRETA) a",
+            "(CORRETA) b",
+            "(INCORRETA) c",
+            "(INCORRETA) d",
+            "(INCORRETA) e",
+        ],
+        "question_explanation": "Explicação",
+        "learning_objective": "Tratamento da hipertensão",
+    }
+
+
+@pytest.fixture
+def state(payload):
+    """Fixture with the graph state right after `generate`."""
+    return {
+        "messages": [
+            HumanMessage(content="Tratamento da hipertensão"),
+            ToolMessage(content="documento", tool_call_id="1"),
+            AIMessage(content=json.dumps(payload), id="generated"),
+        ],
+        "clinical_scenario": "Paciente de 45 anos",
+        "tools": [],
+    }
+
+
+def test_valid_question(payload):
+    """Test if a well-formed question has no errors."""
+    assert validate_question(payload) == {}
+
+
+def test_invalid_questions(payload):
+    """Test if each broken invariant is reported on its field."""
+    assert set(validate_question({**payload, "alternatives": ["A"] * 4})) == {
+        "alternatives"
+    }
+    too_few = payload["alt_explanations"][:4]
+    assert set(validate_question({**payload, "alt_explanations": too_few})) == {
+        "alt_explanations"
+    }
+    no_correct = [
+        exp.replace("(CORRETA)", "(INCORRETA)") for exp in payload["alt_explanations"]
+    ]
+    assert set(validate_question({**payload, "alt_explanations": no_correct})) == {
+        "alt_explanations"
+    }
+    assert set(validate_question({**payload, "learning_objective": ""})) == {
+        "learning_objective"
+    }
+
+
+def test_validation_stats():
+    """Test if the repair and failure rates are computed."""
+    stats = ValidationStats()
+    stats.record("passed")
+    stats.record("repaired", repair_calls=1)
+    stats.record("failed", repair_calls=2)
+    stats.record("passed")
+    report = stats.report()
+    assert report["repair_rate"] == 0.25
+    assert report["failure_rate"] == 0.25
+    assert report["repair_calls"] == 3
+
+
+def test_validate_skips_repair(monkeypatch, state):
+    """Test if a valid question goes through without a repair call."""
+    monkeypatch.setattr(ai_agent, "repair_question", pytest.fail)
+    assert ai_agent.validate(state) == {"messages": []}
+
+
+def test_validate_repairs_broken_fields(monkeypatch, state, payload):
+    """Test if only the broken fields are sent for repair and merged back."""
+    broken = {**payload, "alt_explanations": payload["alt_explanations"][:4]}
+    state["messages"][-1] = AIMessage(content=json.dumps(broken), id="generated")
+    calls = []
+
+    def fake_repair(current, errors, question, context, clinical_scenario):
+        calls.append(set(errors))
+        assert context == "documento"
+        return {"alt_explanations": payload["alt_explanations"]}
+
+    monkeypatch.setattr(ai_agent, "repair_question", fake_repair)
+    result = ai_agent.validate(state)
+    assert calls == [{"alt_explanations"}]
+    message = result["messages"][0]
+    assert message["id"] == "generated"
+    assert json.loads(message["content"]) == payload
+
+
+def test_validate_reports_failure(monkeypatch, state, payload):
+    """Test if a question that cannot be repaired keeps its errors."""
+    broken = {**payload, "alternatives": ["A"] * 4}
+    state["messages"][-1] = AIMessage(content=json.dumps(broken), id="generated")
+    monkeypatch.setattr(ai_agent, "repair_question", lambda *args: {})
+    result = ai_agent.validate(state)
+    content = json.loads(result["messages"][0]["content"])
+    assert "alternatives" in content["validation_errors"]
+
+
+def test_repair_schema_field_order(monkeypatch, payload):
+    """Test if the repair schema lists broken fields in a fixed order."""
+    schemas = []
+
+    def fake_invoke(name, model, schema, **variables):
+        schemas.append(schema)
+        return schema(
+            alternatives=payload["alternatives"],
+            alt_explanations=payload["alt_explanations"],
+            learning_objective=payload["learning_objective"],
+        )
+
+    monkeypatch.setattr(ai_agent, "ChatOpenAI", lambda **kwargs: None)
+    monkeypatch.setattr(ai_agent, "invoke_structured_prompt", fake_invoke)
+    errors = {"learning_objective": "missing", "alternatives": "too few"}
+    repaired = ai_agent.repair_question(payload, errors, "q", "doc", "cenário")
+    assert list(schemas[0].model_fields) == [
+        "alternatives",
+        "alt_explanations",
+        "learning_objective",
+    ]
+    assert repaired["learning_objective"] == payload["learning_objective"]
+
+
+if __name__ == "__main__":
+    pytest.main()
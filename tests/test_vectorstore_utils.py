@@ -0,0 +1,75 @@
+import pytest
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+from quest_generation.vectorstore_utils import (
+    MetadataIndex,
+    build_metadata_filter,
+    create_vectorstore_retriever,
+)
+
+
+@pytest.fixture
+def docs_split():
+    """Fixture with chunks from two guidelines."""
+    return [
+        Document(page_content="a", metadata={"source": "hta.pdf", "page": 1}),
+        Document(page_content="b", metadata={"source": "hta.pdf", "page": 2}),
+        Document(
+            page_content="c",
+            metadata={"source": "dm.pdf", "page": 1, "author": "SBD"},
+        ),
+    ]
+
+
+def test_metadata_index_values(docs_split):
+    """Test if the distinct values of a key are listed."""
+    index = MetadataIndex(docs_split)
+    assert index.values("source") == ["dm.pdf", "hta.pdf"]
+    assert index.values("author") == ["SBD"]
+    assert index.values("specialty") == []
+
+
+def test_metadata_index_save_load(tmp_path, docs_split):
+    """Test if an index survives a save and load, and can be extended."""
+    path = str(tmp_path / "metadata_index.json")
+    assert MetadataIndex.load(path).size == 0
+    MetadataIndex(docs_split[:2]).save(path)
+    index = MetadataIndex.load(path)
+    index.add(docs_split[2:])
+    index.save(path)
+    index = MetadataIndex.load(path)
+    assert index.size == 3
+    assert index.values("page") == [1, 2]
+    assert index.candidates({"source": ["dm.pdf"], "page": [1]}) == {2}
+
+
+def test_metadata_index_candidates(docs_split):
+    """Test if values are OR-ed within a key and AND-ed across keys."""
+    index = MetadataIndex(docs_split)
+    assert index.candidates({"source": ["hta.pdf", "dm.pdf"]}) == {0, 1, 2}
+    assert index.candidates({"source": ["hta.pdf"], "page": [1]}) == {0}
+    assert index.candidates({"source": ["hta.pdf"], "author": ["SBD"]}) == set()
+
+
+def test_build_metadata_filter():
+    """Test if the selection is converted into a Pinecone filter."""
+    assert build_metadata_filter(None) is None
+    assert build_metadata_filter({"source": []}) is None
+    assert build_metadata_filter({"source": ["hta.pdf"]}) == {
+        "source": {"$in": ["hta.pdf"]}
+    }
+
+
+def test_retriever_search_kwargs():
+    """Test if the filter is pushed into the retriever's search kwargs."""
+    vectorstore = InMemoryVectorStore(DeterministicFakeEmbedding(size=8))
+    assert create_vectorstore_retriever(vectorstore).search_kwargs == {}
+    retriever = create_vectorstore_retriever(
+        vectorstore, metadata_filter={"source": ["hta.pdf"], "page": []}
+    )
+    assert retriever.search_kwargs == {"filter": {"source": {"$in": ["hta.pdf"]}}}
+
+
+if __name__ == "__main__":
+    pytest.main()